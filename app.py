@@ -1,7 +1,12 @@
 import os
 import io
-from flask import Flask, render_template, request, jsonify
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from flask import Flask, Response, render_template, request, stream_with_context
 from rag_engine import RagEngine
+from upload_cache import UploadCache
 from dotenv import load_dotenv
 from pypdf import PdfReader
 
@@ -14,6 +19,75 @@ app = Flask(__name__)
 # We instantiate it once. 
 rag_engine = RagEngine()
 
+# Re-uploads of identical PDFs skip parsing (and re-indexing)
+upload_cache = UploadCache(
+    cache_dir=os.getenv("UPLOAD_CACHE_DIR", "cache/uploads"),
+    max_entries=int(os.getenv("UPLOAD_CACHE_SIZE", "200"))
+)
+
+def json_response(payload, status=200):
+    # orjson is several times faster than jsonify's stdlib json on citation payloads
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+def sse_event(payload):
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+# Background PDF parsing, so page extraction overlaps with embedding
+pdf_executor = ThreadPoolExecutor(max_workers=4)
+
+def iter_pdf_pages(reader, max_buffered=16, on_complete=None):
+    """
+    Yields page texts while a worker thread keeps extracting the next pages.
+    Extraction errors are re-raised in the consuming thread.
+    If given, `on_complete(texts)` is called from the worker once every page
+    is extracted, even if the consumer stopped early (e.g. ingest failed).
+    """
+    pages = queue.Queue(maxsize=max_buffered)
+    stopped = threading.Event() # set if the consumer bails out early
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        texts = []
+        outcome = done
+        try:
+            for page in reader.pages:
+                text = page.extract_text() or ""
+                texts.append(text)
+                if not put(text) and on_complete is None:
+                    return
+            if on_complete is not None:
+                try:
+                    on_complete(texts)
+                except Exception as e:
+                    # Best effort (e.g. caching); must not fail the upload
+                    print(f"PDF on_complete Error: {e}")
+        except Exception as e:
+            outcome = e
+        finally:
+            # Always end the stream, or the consumer blocks on pages.get() forever
+            put(outcome)
+
+    pdf_executor.submit(produce)
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -22,54 +96,75 @@ def index():
 def ingest():
     data = request.json
     text_content = data.get('text')
+    namespace = data.get('namespace', "")
     
     if not text_content:
-        return jsonify({"status": "error", "message": "No text provided"}), 400
+        return json_response({"status": "error", "message": "No text provided"}, 400)
+    if not isinstance(namespace, str):
+        return json_response({"status": "error", "message": "'namespace' must be a string"}, 400)
     
     try:
-        num_chunks = rag_engine.ingest_text(text_content)
-        return jsonify({
+        num_chunks = rag_engine.ingest_text(text_content, namespace=namespace)
+        return json_response({
             "status": "success", 
             "message": f"Successfully processed and indexed {num_chunks} chunks."
         })
     except Exception as e:
         # Log the error properly in a real app
         print(f"Ingest Error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return json_response({"status": "error", "message": str(e)}, 500)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
-        return jsonify({"status": "error", "message": "No file part"}), 400
+        return json_response({"status": "error", "message": "No file part"}, 400)
     
     file = request.files['file']
     
     if file.filename == '':
-        return jsonify({"status": "error", "message": "No selected file"}), 400
+        return json_response({"status": "error", "message": "No selected file"}, 400)
         
     if file and file.filename.lower().endswith('.pdf'):
         try:
-            # Read PDF from memory
-            pdf_stream = io.BytesIO(file.read())
-            reader = PdfReader(pdf_stream)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            
-            if not text.strip():
-                 return jsonify({"status": "error", "message": "Could not extract text from PDF (scanned?)"}), 400
-
-            # Reuse existing ingest logic
-            num_chunks = rag_engine.ingest_text(text)
-            return jsonify({
+            raw = file.read()
+            digest = upload_cache.key(raw)
+
+            # Identical bytes already indexed here (and still in the index): nothing to do
+            scope = rag_engine.ingest_scope()
+            chunk_ids = upload_cache.get_ingested(digest, scope)
+            if chunk_ids and rag_engine.has_chunks(chunk_ids):
+                return json_response({
+                    "status": "success", 
+                    "message": f"PDF '{file.filename}' was already indexed ({len(chunk_ids)} chunks)."
+                })
+
+            cached_text = upload_cache.get_text(digest)
+            if cached_text is not None:
+                pages = [cached_text]
+            else:
+                # Read PDF from memory; the text is cached as soon as extraction
+                # finishes, so a retry after a failed ingest skips parsing
+                reader = PdfReader(io.BytesIO(raw))
+                pages = iter_pdf_pages(reader, on_complete=lambda texts: upload_cache.put_text(digest, "\n".join(texts)))
+
+            # Pages are chunked & embedded as they are extracted
+            chunk_ids = rag_engine.ingest_chunks(rag_engine.chunk_stream(pages), source_id=digest[:32])
+            num_chunks = len(chunk_ids)
+
+            if num_chunks == 0:
+                 return json_response({"status": "error", "message": "Could not extract text from PDF (scanned?)"}, 400)
+
+            upload_cache.mark_ingested(digest, scope, chunk_ids)
+
+            return json_response({
                 "status": "success", 
                 "message": f"Successfully processed PDF '{file.filename}' and indexed {num_chunks} chunks."
             })
         except Exception as e:
             print(f"Upload Error: {e}")
-            return jsonify({"status": "error", "message": str(e)}), 500
+            return json_response({"status": "error", "message": str(e)}, 500)
     
-    return jsonify({"status": "error", "message": "Only PDF files are supported currently"}), 400
+    return json_response({"status": "error", "message": "Only PDF files are supported currently"}, 400)
 
 @app.route('/query', methods=['POST'])
 def query():
@@ -77,19 +172,69 @@ def query():
     question = data.get('question')
     
     if not question:
-        return jsonify({"status": "error", "message": "No question provided"}), 400
+        return json_response({"status": "error", "message": "No question provided"}, 400)
+
+    # Streaming: Server-Sent Events with citations, answer tokens as they arrive, then timings
+    if data.get('stream'):
+        def generate():
+            try:
+                for event in rag_engine.search_stream(question):
+                    yield sse_event(event)
+            except Exception as e:
+                print(f"Query Error: {e}")
+                yield sse_event({"event": "error", "message": str(e)})
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
     
     try:
         result = rag_engine.search(question)
-        return jsonify({
+        return json_response({
             "status": "success", 
             "answer": result['answer'],
             "citations": result['citations'],
+            "citations_used": result['citations_used'],
             "timings": result['timings']
         })
     except Exception as e:
         print(f"Query Error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return json_response({"status": "error", "message": str(e)}, 500)
+
+# Upper bound on questions per /query_batch call
+MAX_BATCH_QUESTIONS = 100
+
+@app.route('/query_batch', methods=['POST'])
+def query_batch():
+    data = request.json
+    questions = data.get('questions')
+    namespace = data.get('namespace', "")
+    
+    if not questions or not isinstance(questions, list) or not all(isinstance(q, str) and q for q in questions):
+        return json_response({"status": "error", "message": "'questions' must be a non-empty list of strings"}, 400)
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return json_response({"status": "error", "message": f"At most {MAX_BATCH_QUESTIONS} questions per batch"}, 400)
+    if not isinstance(namespace, str):
+        return json_response({"status": "error", "message": "'namespace' must be a string"}, 400)
+    
+    try:
+        results = rag_engine.search_batch(questions, namespace=namespace)
+        return json_response({
+            "status": "success",
+            "results": [
+                {"question": question, **result} if result.get('status') == "error" else {
+                    "question": question,
+                    "status": "success",
+                    "answer": result['answer'],
+                    "citations": result['citations'],
+                    "citations_used": result['citations_used'],
+                    "timings": result['timings']
+                }
+                for question, result in zip(questions, results)
+            ]
+        })
+    except Exception as e:
+        print(f"Query Batch Error: {e}")
+        return json_response({"status": "error", "message": str(e)}, 500)
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
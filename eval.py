@@ -7,7 +7,69 @@ import os
 # 2. python eval.py
 
 class TestMiniRAG(unittest.TestCase):
+    qa_pairs = [
+        {
+            "question": "Who was the first person to walk on the moon?",
+            "expected_keywords": ["Neil Armstrong", "Armstrong"]
+        },
+        {
+            "question": "What date did they land on the moon?",
+            "expected_keywords": ["July 20, 1969"]
+        },
+        {
+            "question": "How long did they spend on the lunar surface outside the spacecraft?",
+            "expected_keywords": ["two and a quarter hours", "2.25 hours"]
+        },
+        {
+            "question": "What rocket launched the mission?",
+            "expected_keywords": ["Saturn V"]
+        },
+        {
+            "question": "What were the three parts of the Apollo spacecraft?",
+            "expected_keywords": ["command module", "service module", "lunar module"]
+        }
+    ]
     
+    # Retrieval golden set: several documents chunked finely so each answer
+    # lives in one of many chunks (recall over a single chunk is always 1.0)
+    recall_namespace = "eval-recall"
+    recall_docs = [
+        """
+        Apollo 13 was launched on April 11, 1970, as the seventh crewed mission of the Apollo program.
+        Two days into the flight an oxygen tank in the service module exploded, forcing the crew to abort the lunar landing.
+        Jim Lovell, Jack Swigert and Fred Haise used the lunar module Aquarius as a lifeboat.
+        They splashed down safely in the Pacific Ocean on April 17, 1970.
+        """,
+        """
+        The Hubble Space Telescope was carried into low Earth orbit in 1990 by the Space Shuttle Discovery.
+        Its 2.4-meter primary mirror turned out to suffer from spherical aberration, blurring its images.
+        The first servicing mission in December 1993 installed corrective optics called COSTAR.
+        Hubble observations helped pin down the expansion rate of the universe, the Hubble constant.
+        """,
+        """
+        Voyager 1 was launched by NASA on September 5, 1977, to study Jupiter, Saturn and their moons.
+        On August 25, 2012 it crossed the heliopause and became the first spacecraft in interstellar space.
+        It carries a gold-plated phonograph disc, the Golden Record, with sounds and images of life on Earth.
+        Its instruments are powered by radioisotope thermoelectric generators that lose output every year.
+        """,
+        """
+        The Curiosity rover landed in Gale Crater on Mars on August 6, 2012.
+        Its final descent used a rocket-powered sky crane that lowered the rover on cables.
+        Curiosity has been climbing Mount Sharp, a layered mountain in the middle of the crater.
+        Its drill samples showed that ancient Mars had lakes with conditions suitable for microbial life.
+        """,
+    ]
+    recall_pairs = [
+        {"question": "What exploded on Apollo 13?", "expected_keywords": ["oxygen tank"]},
+        {"question": "Which spacecraft did the Apollo 13 crew use as a lifeboat?", "expected_keywords": ["Aquarius"]},
+        {"question": "What was wrong with Hubble's mirror?", "expected_keywords": ["spherical aberration"]},
+        {"question": "How was Hubble's optics problem fixed?", "expected_keywords": ["COSTAR"]},
+        {"question": "When did Voyager 1 reach interstellar space?", "expected_keywords": ["August 25, 2012"]},
+        {"question": "What record does Voyager 1 carry?", "expected_keywords": ["Golden Record"]},
+        {"question": "How was Curiosity lowered onto the surface of Mars?", "expected_keywords": ["sky crane"]},
+        {"question": "Which rocket launched Apollo 11?", "expected_keywords": ["Saturn V"]},
+    ]
+
     @classmethod
     def setUpClass(cls):
         print("Initializing RAG Engine for Eval...")
@@ -28,29 +90,41 @@ class TestMiniRAG(unittest.TestCase):
         print("Ingesting sample text...")
         cls.engine.ingest_text(cls.sample_text)
 
+        # Small chunks for the retrieval set, in its own namespace
+        chunk_size, chunk_overlap = cls.engine.chunk_size, cls.engine.chunk_overlap
+        cls.engine.chunk_size, cls.engine.chunk_overlap = 32, 8
+        try:
+            cls.recall_chunks = sum(
+                cls.engine.ingest_text(doc, namespace=cls.recall_namespace)
+                for doc in [cls.sample_text] + cls.recall_docs
+            )
+        finally:
+            cls.engine.chunk_size, cls.engine.chunk_overlap = chunk_size, chunk_overlap
+
+    def test_retrieval_recall(self):
+        # Recall@k of vector search alone: is a chunk containing an expected
+        # keyword among the first k results? Use to tune RETRIEVAL_TOP_K down
+        # until recall drops.
+        top_k = self.engine.top_k_retrieval
+        ks = sorted({k for k in (1, 3, 5) if k < top_k} | {top_k})
+        print(f"\n--- Retrieval Recall ({self.recall_chunks} chunks) ---")
+        hits = {k: 0 for k in ks}
+        for pair in self.recall_pairs:
+            docs = self.engine.retrieve(pair['question'], namespace=self.recall_namespace)
+            ranks = [i for i, d in enumerate(docs)
+                     if any(kw.lower() in d['text'].lower() for kw in pair['expected_keywords'])]
+            first = ranks[0] + 1 if ranks else None
+            for k in ks:
+                hits[k] += first is not None and first <= k
+            print(f"{'[HIT] ' if first else '[MISS]'} rank={first} {pair['question']}")
+
+        for k in ks:
+            print(f"Recall@{k}: {hits[k] / len(self.recall_pairs):.2f}")
+        recall = hits[top_k] / len(self.recall_pairs)
+        self.assertTrue(recall >= 0.8, f"Retrieval should surface the answer for at least 80% of questions within top {top_k}")
+
     def test_qa_pairs(self):
-        qa_pairs = [
-            {
-                "question": "Who was the first person to walk on the moon?",
-                "expected_keywords": ["Neil Armstrong", "Armstrong"]
-            },
-            {
-                "question": "What date did they land on the moon?",
-                "expected_keywords": ["July 20, 1969"]
-            },
-            {
-                "question": "How long did they spend on the lunar surface outside the spacecraft?",
-                "expected_keywords": ["two and a quarter hours", "2.25 hours"]
-            },
-            {
-                "question": "What rocket launched the mission?",
-                "expected_keywords": ["Saturn V"]
-            },
-            {
-                "question": "What were the three parts of the Apollo spacecraft?",
-                "expected_keywords": ["command module", "service module", "lunar module"]
-            }
-        ]
+        qa_pairs = self.qa_pairs
         
         print("\n--- Running Evaluation (5 Pairs) ---")
         score = 0
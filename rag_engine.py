@@ -1,57 +1,498 @@
 import os
+import json
+import datetime
+import hashlib
 import time
 import logging
-import uuid
-from typing import List, Dict, Any
+import random
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator
 
+import numpy as np
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from pinecone import Pinecone, ServerlessSpec
 import cohere
+import httpx
 import tiktoken
 from dotenv import load_dotenv
 
+try:
+    # Optional: BM25 sparse vectors for hybrid (keyword + dense) retrieval
+    from pinecone_text.sparse import BM25Encoder
+except ImportError:
+    BM25Encoder = None
+
 load_dotenv()
 
 # Logger setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = (
+    "You are an intelligent AI assistant capable of synthesizing information. "
+    "Answer the user's question by *synthesizing* and *summarizing* the relevant information from the provided context below. "
+    "Do not just copy-paste text (extractive); instead, provide a well-written, abstractive summary that directly answers the question. "
+    "However, you MUST still ground your answer in the provided context and include citations [x] where appropriate. "
+    "If the answer is not in the context, say 'I cannot answer this based on the provided documents.'"
+)
+
+def _load_tokenizer():
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Fallback if tiktoken fails (unlikely)
+        return None
+
+# Process-wide singletons, set up at import time. Under `gunicorn --preload`
+# the master imports this module once and forked workers share the BPE
+# tables (~50 MB) and client config copy-on-write instead of each reloading them.
+_tokenizer = _load_tokenizer()
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+if GOOGLE_API_KEY:
+    genai.configure(api_key=GOOGLE_API_KEY)
+
+def l2_normalize(vectors) -> np.ndarray:
+    """
+    Scales each vector (or each row of a matrix) to unit length, so dot
+    product equals cosine similarity.
+    """
+    v = np.asarray(vectors, dtype=np.float32)
+    return v / (np.linalg.norm(v, axis=-1, keepdims=True) + 1e-12)
+
+class SemanticCache:
+    """
+    Caches answers keyed on the query embedding. A lookup is a single
+    matrix-vector product against all cached (L2-normalized) query vectors;
+    anything above `threshold` cosine similarity is treated as the same question.
+
+    Vectors are stored int8 with a per-row scale (4x smaller than float32).
+    The newest `shadow_size` entries also keep their float32 vector so fresh
+    paraphrases are matched without quantization error.
+
+    With a `path`, entries are persisted for other worker processes:
+        {path}.npz  vectors + payloads in one file, written in the background
+                    at most every `save_delay` seconds (never on the request path)
+        {path}.gen  generation token; `clear()` replaces it, and every process
+                    drops its entries when it sees a new token (checked at most
+                    every `generation_check_interval` seconds)
+    """
+    def __init__(self, threshold: float = 0.92, max_entries: int = 1000, path: Optional[str] = None,
+                 shadow_size: int = 64, save_delay: float = 5.0, generation_check_interval: float = 1.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.shadow_size = shadow_size
+        self.save_delay = save_delay
+        self.generation_check_interval = generation_check_interval
+
+        self.Q = None # (max_entries, dim) int8, allocated on first insert
+        self.scales = np.zeros(max_entries, dtype=np.float32) # per-row quantization scale
+        self.shadow = OrderedDict() # row -> float32 vector, newest last
+        self.payloads = [] # parallel to rows of Q: {"answer", "citations"}
+        self.last_used = np.zeros(max_entries, dtype=np.int64) # LRU clock per row
+        self.clock = 0
+        self.lock = threading.Lock()
+
+        self.generation = ""
+        self.generation_checked_at = 0.0
+        self.save_pending = False
+
+        if self.path:
+            self.generation = self._read_generation()
+            self.generation_checked_at = time.time()
+            self._load()
+
+    @staticmethod
+    def quantize(vec: np.ndarray):
+        """
+        Symmetric int8 quantization: returns (q, scale) with vec ~= q / scale.
+        """
+        scale = np.float32(127.0 / (np.max(np.abs(vec)) + 1e-12))
+        return np.round(vec * scale).astype(np.int8), scale
+
+    def lookup(self, query_vec: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached payload for the closest query above threshold, or None.
+        `query_vec` must already be normalized.
+        """
+        self._check_generation()
+        with self.lock:
+            size = len(self.payloads)
+            if size == 0 or self.Q.shape[1] != query_vec.shape[0]:
+                return None
+
+            q, q_scale = self.quantize(query_vec)
+            dots = np.matmul(self.Q[:size], q, dtype=np.int32)
+            sims = dots / (self.scales[:size] * q_scale)
+
+            # Exact scores for the freshest entries
+            for row, vec in self.shadow.items():
+                sims[row] = vec @ query_vec
+
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+
+            self.clock += 1
+            self.last_used[best] = self.clock
+            return self.payloads[best]
+
+    def add(self, query_vec: np.ndarray, answer: str, citations: List[Dict]):
+        with self.lock:
+            if self.Q is None or self.Q.shape[1] != query_vec.shape[0]:
+                self.Q = np.zeros((self.max_entries, query_vec.shape[0]), dtype=np.int8)
+                self.payloads = []
+                self.shadow.clear()
+
+            if len(self.payloads) < self.max_entries:
+                row = len(self.payloads)
+                self.payloads.append(None)
+            else:
+                # Evict the least recently used entry
+                row = int(np.argmin(self.last_used))
+
+            self.clock += 1
+            self.Q[row], self.scales[row] = self.quantize(query_vec)
+            self.payloads[row] = {"answer": answer, "citations": citations}
+            self.last_used[row] = self.clock
+
+            self.shadow.pop(row, None)
+            self.shadow[row] = query_vec.astype(np.float32)
+            while len(self.shadow) > self.shadow_size:
+                self.shadow.popitem(last=False)
+
+            if self.path and not self.save_pending:
+                self.save_pending = True
+                timer = threading.Timer(self.save_delay, self.flush)
+                timer.daemon = True
+                timer.start()
+
+    def clear(self):
+        """
+        Drops all entries, in this process and (via the generation token) in
+        every other process sharing `path`.
+        """
+        with self.lock:
+            self._reset()
+            if self.path:
+                self.generation = os.urandom(8).hex()
+                self._atomic_write(self.path + ".gen", lambda f: f.write(self.generation.encode()))
+
+    def flush(self):
+        """
+        Writes the current entries to disk. Runs on a timer thread after `add`;
+        the lock is only held to snapshot, not for serialization or I/O.
+        """
+        with self.lock:
+            self.save_pending = False
+            size = len(self.payloads)
+            generation = self.generation
+            Q = self.Q[:size].copy() if self.Q is not None else np.zeros((0, 0), dtype=np.int8)
+            scales = self.scales[:size].copy()
+            last_used = self.last_used[:size].copy()
+            payloads = list(self.payloads)
+
+        # A clear() elsewhere made these entries stale; don't resurrect them
+        if generation != self._read_generation():
+            return
+
+        # Citations are persisted whole so replayed answers keep the /query shape
+        payload_bytes = np.frombuffer(json.dumps(payloads).encode(), dtype=np.uint8)
+        self._atomic_write(self.path + ".npz", lambda f: np.savez(
+            f, Q=Q, scales=scales, last_used=last_used, payloads=payload_bytes,
+            generation=np.frombuffer(generation.encode(), dtype=np.uint8)
+        ))
+
+    def _reset(self):
+        self.payloads = []
+        self.shadow.clear()
+        self.last_used[:] = 0
+
+    def _check_generation(self):
+        if not self.path or time.time() - self.generation_checked_at < self.generation_check_interval:
+            return
+        generation = self._read_generation()
+        with self.lock:
+            self.generation_checked_at = time.time()
+            if generation != self.generation:
+                logger.info("Semantic cache invalidated by another process.")
+                self.generation = generation
+                self._reset()
+
+    def _read_generation(self) -> str:
+        try:
+            with open(self.path + ".gen", "rb") as f:
+                return f.read().decode()
+        except OSError:
+            return ""
+
+    def _atomic_write(self, target: str, write_fn: Callable[[Any], None]):
+        # Per-process temp file + rename, so concurrent writers never share a
+        # temp file and readers never see a half-written one
+        directory = os.path.dirname(target) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    write_fn(f)
+                os.replace(tmp_path, target)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"Failed to persist semantic cache: {e}")
+
+    def _load(self):
+        # Any unreadable / torn / foreign file just means an empty cache
+        try:
+            with open(self.path + ".npz", "rb") as f, np.load(f) as data:
+                if data["generation"].tobytes().decode() != self.generation:
+                    return
+                Q = data["Q"][: self.max_entries]
+                scales = data["scales"][: len(Q)]
+                last_used = data["last_used"][: len(Q)]
+                payloads = json.loads(data["payloads"].tobytes().decode())[: len(Q)]
+            if len(Q) == 0 or len(payloads) != len(Q) or len(scales) != len(Q):
+                return
+        except Exception:
+            return
+
+        self.Q = np.zeros((self.max_entries, Q.shape[1]), dtype=np.int8)
+        self.Q[: len(Q)] = Q
+        self.scales[: len(Q)] = scales
+        self.payloads = payloads
+        self.last_used[: len(Q)] = last_used
+        self.clock = int(self.last_used.max())
+        logger.info(f"Loaded {len(self.payloads)} semantic cache entries.")
+
+class QueryCoalescer:
+    """
+    Collects items submitted by concurrent requests within a short window and
+    hands them to `batch_fn` as one list, so N requests cost one API round trip.
+    `batch_fn` must return one result per input, in order; a result that is an
+    Exception is raised to that caller only.
+    """
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], window_ms: float = 8, max_batch: int = 100):
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+
+        self.pending = [] # List of (item, Future)
+        self.lock = threading.Lock()
+
+    def submit(self, item: Any) -> Any:
+        if self.window <= 0:
+            result = self.batch_fn([item])[0]
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        future = Future()
+        with self.lock:
+            self.pending.append((item, future))
+            is_leader = len(self.pending) == 1
+            is_full = len(self.pending) >= self.max_batch
+
+        if is_full:
+            self._flush()
+        elif is_leader:
+            # First arrival waits out the window, then flushes for everyone
+            time.sleep(self.window)
+            self._flush()
+
+        return future.result()
+
+    def _flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Never leave a caller blocked: short result lists, or a
+            # BaseException (e.g. gevent Timeout) interrupting the batch
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Coalesced batch returned no result for this item"))
+
+class LocalReranker:
+    """
+    Cross-encoder reranker (e.g. ms-marco-MiniLM-L-6-v2 exported to ONNX)
+    run on CPU with ONNX Runtime. Scores all (query, doc) pairs in one
+    batched forward pass, avoiding a network round trip for small top_k.
+    """
+    def __init__(self, model_path: str, tokenizer_name: str, num_threads: Optional[int] = None, max_length: int = 512):
+        # Optional dependencies, only needed for RERANK_BACKEND=local
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Physical cores; hyperthreads don't help GEMM-bound inference
+        options.intra_op_num_threads = num_threads or max(1, (os.cpu_count() or 2) // 2)
+
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        self.max_length = max_length
+
+    def rerank(self, query: str, documents: List[str], top_n: int) -> List[int]:
+        """
+        Returns indices into `documents` of the `top_n` best matches, best first.
+        """
+        features = self.tokenizer(
+            [query] * len(documents),
+            documents,
+            padding="longest",
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np"
+        )
+        feeds = {k: v.astype(np.int64) for k, v in features.items() if k in self.input_names}
+        logits = self.session.run(None, feeds)[0].reshape(len(documents), -1)[:, 0]
+        return [int(i) for i in np.argsort(-logits)[:top_n]]
+
 class RagEngine:
     def __init__(self):
+        # Embedding size, shared by Gemini output and the Pinecone index.
+        # text-embedding-004 can truncate below 768; 256 stores ~3x less per vector.
+        self.embed_dim = int(os.getenv("EMBED_DIM", "768"))
+
         # 1. Initialize Clients
         self._init_google()
         self._init_pinecone()
+        self._init_sparse_encoder()
         self._init_cohere()
+        self._init_local_reranker()
         
         # 2. Configs for functionality
         self.chunk_size = 1000 # tokens (approx)
         self.chunk_overlap = 150 # tokens
-        self.top_k_retrieval = 10
+        # Candidates fetched from Pinecone: the main recall/latency knob.
+        # `python eval.py` reports recall@k over a multi-chunk corpus.
+        self.top_k_retrieval = int(os.getenv("RETRIEVAL_TOP_K", "10"))
+        # Dedicated read node (DRN) indexes also accept scan_factor (>1 scans
+        # more of the index) and max_candidates (>= top_k); sent only when set.
+        self.query_params = {}
+        if os.getenv("RETRIEVAL_SCAN_FACTOR"):
+            self.query_params["scan_factor"] = float(os.getenv("RETRIEVAL_SCAN_FACTOR"))
+        if os.getenv("RETRIEVAL_MAX_CANDIDATES"):
+            max_candidates = int(os.getenv("RETRIEVAL_MAX_CANDIDATES"))
+            if max_candidates < self.top_k_retrieval:
+                logger.warning(f"RETRIEVAL_MAX_CANDIDATES ({max_candidates}) is below RETRIEVAL_TOP_K; using {self.top_k_retrieval}.")
+                max_candidates = self.top_k_retrieval
+            self.query_params["max_candidates"] = max_candidates
         self.top_n_rerank = 5
+        self.context_budget = int(os.getenv("CTX_BUDGET", "2000")) # max context tokens sent to the LLM
+        self.context_last_doc_tokens = 500 # head kept from the doc that overflows the budget
+        self.rerank_skip_gap = float(os.getenv("RERANK_SKIP_GAP", "0.15")) # on cosine scores
+        # Hybrid scores are unbounded, so the cosine gap doesn't carry over.
+        # Unset = always rerank when BM25 is on; calibrate from the gap log line.
+        skip_gap_hybrid = os.getenv("RERANK_SKIP_GAP_HYBRID")
+        self.rerank_skip_gap_hybrid = float(skip_gap_hybrid) if skip_gap_hybrid else None
+
+        # Concurrent Gemini embed calls during ingest (bounded by API QPS limits)
+        self.embed_workers = int(os.getenv("EMBED_WORKERS", "8"))
+        self.embed_executor = ThreadPoolExecutor(max_workers=self.embed_workers)
+
+        # Coalesce concurrent queries into batched embed / retrieval calls
+        window_ms = float(os.getenv("QUERY_COALESCE_MS", "8"))
+        self.embed_coalescer = QueryCoalescer(self._embed_queries, window_ms=window_ms)
+        self.retrieval_coalescer = QueryCoalescer(self._query_index, window_ms=window_ms)
+
+        # Semantic cache: near-duplicate questions reuse the previous answer
+        self.cache = SemanticCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+            path=os.getenv("SEMANTIC_CACHE_PATH", "cache/semantic_cache")
+        )
         
         # Tokenizer for estimation
-        try:
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
-        except:
-             # Fallback if tiktoken fails (unlikely)
-            self.tokenizer = None
+        self.tokenizer = _tokenizer
 
     def _init_google(self):
-        self.google_api_key = os.getenv("GOOGLE_API_KEY")
+        # genai is configured once at module scope. Its default gRPC transport
+        # keeps one cached client / HTTP2 channel per process, so calls already
+        # reuse the connection.
+        self.google_api_key = GOOGLE_API_KEY
         if self.google_api_key:
-            genai.configure(api_key=self.google_api_key)
             self.embed_model = "models/text-embedding-004"
-            self.llm_model = genai.GenerativeModel("gemini-2.5-flash")
+            self.llm_model_name = "models/gemini-2.5-flash"
+            self.llm_cache_ttl = int(os.getenv("LLM_CACHE_TTL", "3600")) # seconds
+            # Gemini rejects caches below a minimum size (1024 tokens for 2.5 Flash)
+            self.llm_cache_min_tokens = int(os.getenv("LLM_CACHE_MIN_TOKENS", "1024"))
+            self.llm_model = None
+            self.llm_prompt_digest = None
+            self.llm_model_expiry = 0.0
+            self.llm_lock = threading.Lock() # context cache is created on first use, after fork
             logger.info("Google Gemini initialized.")
         else:
             logger.warning("GOOGLE_API_KEY not found. LLM features will fail.")
 
+    def _get_llm_model(self):
+        """
+        Returns the generation model for SYSTEM_PROMPT. The prompt that ships
+        (~130 tokens) is below `llm_cache_min_tokens`, so this is normally a
+        plain model with the prompt as system instruction. A prompt at or
+        above the minimum is put in a Gemini context cache so it isn't
+        re-prefilled on every call; the cache is recreated when it nears its
+        TTL or the prompt changes, and a rejected cache falls back to the
+        plain model.
+        """
+        digest = hashlib.sha256(SYSTEM_PROMPT.encode()).hexdigest()
+        with self.llm_lock:
+            if self.llm_model and digest == self.llm_prompt_digest and time.time() < self.llm_model_expiry:
+                return self.llm_model
+
+            if self.count_tokens(SYSTEM_PROMPT) < self.llm_cache_min_tokens:
+                self.llm_model = genai.GenerativeModel(self.llm_model_name, system_instruction=SYSTEM_PROMPT)
+                self.llm_model_expiry = float("inf")
+                self.llm_prompt_digest = digest
+                return self.llm_model
+
+            try:
+                cached = genai.caching.CachedContent.create(
+                    model=self.llm_model_name,
+                    system_instruction=SYSTEM_PROMPT,
+                    ttl=datetime.timedelta(seconds=self.llm_cache_ttl)
+                )
+                self.llm_model = genai.GenerativeModel.from_cached_content(cached)
+                # Refresh a minute early so in-flight calls never hit an expired cache
+                self.llm_model_expiry = time.time() + self.llm_cache_ttl - 60
+                logger.info("Gemini context cache created for system prompt.")
+            except Exception as e:
+                logger.warning(f"Gemini context caching unavailable: {e}. Using uncached system instruction.")
+                self.llm_model = genai.GenerativeModel(self.llm_model_name, system_instruction=SYSTEM_PROMPT)
+                self.llm_model_expiry = float("inf")
+
+            self.llm_prompt_digest = digest
+            return self.llm_model
+
     def _init_pinecone(self):
         self.pinecone_api_key = os.getenv("PINECONE_API_KEY")
         self.index_name = os.getenv("PINECONE_INDEX_NAME", "minirag-index")
         
         if self.pinecone_api_key:
-            self.pc = Pinecone(api_key=self.pinecone_api_key)
+            # pool_threads backs async_req=True calls (parallel queries / upserts);
+            # the threads share one urllib3 keep-alive connection pool
+            self.pc = Pinecone(api_key=self.pinecone_api_key, pool_threads=30)
             
             # Check if index exists, else create (Serverless spec)
             existing_indexes = [i.name for i in self.pc.list_indexes()]
@@ -60,158 +501,346 @@ class RagEngine:
                 try:
                     self.pc.create_index(
                         name=self.index_name,
-                        dimension=768, # Dimension for text-embedding-004
-                        metric="cosine",
+                        dimension=self.embed_dim, # text-embedding-004 (768 max)
+                        metric="dotproduct", # vectors are pre-normalized, so this equals cosine; also required for hybrid search
                         spec=ServerlessSpec(cloud="aws", region="us-east-1")
                     )
+                    self.index_metric = "dotproduct"
                 except Exception as e:
                     logger.error(f"Failed to create index: {e}")
+                    self.index_metric = None
+            else:
+                description = self.pc.describe_index(self.index_name)
+                self.index_metric = description.metric
+                index_dim = description.dimension
+                if index_dim != self.embed_dim:
+                    logger.error(f"Index '{self.index_name}' has dimension {index_dim} but EMBED_DIM is {self.embed_dim}. Use a new index name or matching EMBED_DIM.")
             
-            self.index = self.pc.Index(self.index_name)
+            self.index = self.pc.Index(self.index_name, pool_threads=30)
             logger.info("Pinecone initialized.")
         else:
             self.pc = None
             self.index = None
+            self.index_metric = None
             logger.warning("PINECONE_API_KEY not found. Retrieval will fail.")
 
+    def _init_sparse_encoder(self):
+        """
+        BM25 encoder for hybrid retrieval. Only enabled when pinecone-text is
+        installed and the index uses the dotproduct metric (Pinecone rejects
+        sparse values on cosine indexes).
+        """
+        self.bm25 = None
+        self.hybrid_alpha = float(os.getenv("HYBRID_ALPHA", "0.75")) # 1.0 = dense only, 0.0 = BM25 only
+        if BM25Encoder is None or self.index_metric != "dotproduct":
+            logger.info("Hybrid search disabled (needs pinecone-text and a dotproduct index).")
+            return
+
+        # Ingest and query must share the same BM25 parameters, so they are
+        # persisted. Starts from MS MARCO-fitted defaults; refitting on each
+        # upload would silently change the weights of everything indexed before.
+        # To use corpus-specific stats, fit offline and dump to this path.
+        params_path = os.getenv("BM25_PARAMS_PATH", "cache/bm25_params.json")
+        try:
+            if os.path.exists(params_path):
+                self.bm25 = BM25Encoder().load(params_path)
+            else:
+                self.bm25 = BM25Encoder.default()
+                os.makedirs(os.path.dirname(params_path) or ".", exist_ok=True)
+                self.bm25.dump(params_path)
+            logger.info("BM25 sparse encoder initialized (hybrid search).")
+        except Exception as e:
+            logger.error(f"Failed to load BM25 encoder: {e}. Hybrid search disabled.")
+            self.bm25 = None
+
     def _init_cohere(self):
         self.cohere_key = os.getenv("COHERE_API_KEY")
         if self.cohere_key:
-            self.co = cohere.Client(self.cohere_key)
+            # One keep-alive HTTP/2 pool shared by every rerank call, instead of
+            # a fresh TCP+TLS handshake per request
+            self.cohere_http = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+            )
+            self.co = cohere.Client(self.cohere_key, httpx_client=self.cohere_http)
             logger.info("Cohere initialized.")
         else:
             self.co = None
             logger.warning("COHERE_API_KEY not found. Reranking will fail.")
 
+    def _init_local_reranker(self):
+        self.local_reranker = None
+        if os.getenv("RERANK_BACKEND", "cohere").lower() != "local":
+            return
+
+        try:
+            threads = os.getenv("RERANK_THREADS")
+            self.local_reranker = LocalReranker(
+                model_path=os.getenv("RERANK_ONNX_MODEL", "models/ms-marco-MiniLM-L-6-v2/model.onnx"),
+                tokenizer_name=os.getenv("RERANK_TOKENIZER", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                num_threads=int(threads) if threads else None
+            )
+            logger.info("Local cross-encoder reranker initialized.")
+        except Exception as e:
+            logger.error(f"Failed to load local reranker: {e}. Falling back to Cohere.")
+
     def count_tokens(self, text: str) -> int:
         if self.tokenizer:
             return len(self.tokenizer.encode(text))
         return len(text) // 4 # Rough estimate
 
+    def truncate_tokens(self, text: str, max_tokens: int) -> str:
+        if self.tokenizer:
+            return self.tokenizer.decode(self.tokenizer.encode(text)[:max_tokens])
+        return text[: max_tokens * 4] # Rough estimate
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embeds a batch of queries in one Gemini call. Rows are L2-normalized
+        to match the stored document vectors (see `_embed_documents`).
+        """
+        result = genai.embed_content(
+            model=self.embed_model,
+            content=queries,
+            task_type="retrieval_query",
+            output_dimensionality=self.embed_dim
+        )
+        return l2_normalize(result['embedding'])
+
+    def _query_index(self, requests: List[Any]) -> List[Any]:
+        """
+        Fans out one Pinecone query per (vector, sparse_vector, namespace)
+        request over the index's thread pool and waits for all of them.
+        `sparse_vector` may be None for dense-only search.
+        A failed request yields its exception in place of a result, so it only
+        fails its own caller (see `QueryCoalescer`).
+        """
+        async_results = []
+        for vec, sparse, namespace in requests:
+            try:
+                async_results.append(self.index.query(
+                    vector=vec.tolist(),
+                    sparse_vector=sparse,
+                    top_k=self.top_k_retrieval,
+                    namespace=namespace,
+                    include_metadata=True,
+                    async_req=True,
+                    **self.query_params
+                ))
+            except Exception as e:
+                async_results.append(e)
+
+        results = []
+        for r in async_results:
+            try:
+                results.append(r if isinstance(r, Exception) else r.get())
+            except Exception as e:
+                results.append(e)
+        return results
+
     def chunk_text(self, text: str) -> List[str]:
         """
         Splits text into chunks of roughly `chunk_size` tokens with `chunk_overlap`.
         """
-        tokens = self.tokenizer.encode(text) if self.tokenizer else list(text) # Fallback is bad but functional
-        
-        chunks = []
-        for i in range(0, len(tokens), self.chunk_size - self.chunk_overlap):
-            chunk_tokens = tokens[i : i + self.chunk_size]
-            if self.tokenizer:
-                chunk_text = self.tokenizer.decode(chunk_tokens)
-            else:
-                chunk_text = "".join(chunk_tokens)
-            chunks.append(chunk_text)
-        
-        return chunks
+        stride = self.chunk_size - self.chunk_overlap
+
+        if not self.tokenizer:
+            # Same windows over characters, at ~4 chars per token (see count_tokens)
+            size, step = self.chunk_size * 4, stride * 4
+            return [text[i : i + size] for i in range(0, len(text), step)]
 
-    def ingest_text(self, text: str):
+        # Encode once, then decode every window in a single batched call
+        tokens = self.tokenizer.encode(text)
+        windows = [tokens[i : i + self.chunk_size] for i in range(0, len(tokens), stride)]
+        return self.tokenizer.decode_batch(windows)
+
+    def chunk_stream(self, texts: Iterable[str]) -> Iterator[str]:
         """
-        Chunks text, creates embeddings, and upserts to Pinecone.
+        Streaming variant of `chunk_text` for text that arrives in pieces
+        (e.g. PDF pages). Yields each window as soon as enough tokens are buffered.
         """
-        if not self.index or not self.google_api_key:
-            raise ValueError("Services not configured. check .env")
+        stride = self.chunk_size - self.chunk_overlap
+        buffer = [] # tokens (or characters without a tokenizer)
+        size = self.chunk_size if self.tokenizer else self.chunk_size * 4
+        step = stride if self.tokenizer else stride * 4
+        emitted = False
+
+        def decode(window):
+            return self.tokenizer.decode(window) if self.tokenizer else "".join(window)
+
+        for text in texts:
+            if not text or not text.strip():
+                continue
+            buffer.extend(self.tokenizer.encode(text + "\n") if self.tokenizer else text + "\n")
+
+            while len(buffer) >= size:
+                yield decode(buffer[:size])
+                del buffer[:step]
+                emitted = True
+
+        # Remainder, unless it is only the overlap of the last emitted window
+        if buffer and (not emitted or len(buffer) > size - step):
+            yield decode(buffer)
 
+    def ingest_text(self, text: str, namespace: str = ""):
+        """
+        Chunks text, creates embeddings, and upserts to Pinecone.
+        """
         # 1. Chunk
         chunks = self.chunk_text(text)
         logger.info(f"Created {len(chunks)} chunks.")
 
-        # 2. Embed
-        # Gemini batch embedding
-        # Prepare content for embedding
-        points_to_upsert = []
-        
-        # Batching for API limits (Gemini has limits on list size)
-        batch_size = 50 
-        for i in range(0, len(chunks), batch_size):
-            batch_chunks = chunks[i : i + batch_size]
-            
-            # Get embeddings
-            result = genai.embed_content(
-                model=self.embed_model,
-                content=batch_chunks,
-                task_type="retrieval_document"
-            )
-            embeddings = result['embedding']
+        source_id = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return len(self.ingest_chunks(chunks, source_id=source_id, namespace=namespace))
+
+    def ingest_chunks(self, chunks: Iterable[str], source_id: Optional[str] = None, namespace: str = "") -> List[str]:
+        """
+        Embeds and upserts chunks to Pinecone. `chunks` may be a generator
+        (see `chunk_stream`); batches are embedded as soon as they fill up.
+        Returns the IDs of the indexed chunks.
 
+        IDs are `{source_id}#{position}` (or a hash of content + position
+        without a source_id), so re-ingesting the same document overwrites
+        its vectors in place, while identical chunks within a document
+        (repeated headers, boilerplate) still get distinct IDs.
+        """
+        if not self.index or not self.google_api_key:
+            raise ValueError("Services not configured. check .env")
+
+        # 2. Embed & Upsert
+        # Embed calls run concurrently on `embed_executor` (they are dominated by
+        # API latency), and each finished batch is upserted asynchronously on the
+        # index's thread pool. Batches are consumed in submission order so
+        # positions stay correct.
+        # Batches of 100 match both Gemini's list limit and Pinecone's recommendation.
+        batch_size = 100
+        pending = deque() # (position, batch_chunks, embed future), oldest first
+        async_results = []
+        chunk_ids = []
+        position = 0
+
+        def upsert_oldest():
+            start_pos, batch_chunks, future = pending.popleft()
+            embeddings = future.result()
+            sparse_vectors = self.bm25.encode_documents(batch_chunks) if self.bm25 else None
+
+            points_to_upsert = []
             for j, emb in enumerate(embeddings):
-                chunk_id = str(uuid.uuid4())
                 chunk_content = batch_chunks[j]
+                if source_id:
+                    chunk_id = f"{source_id}#{start_pos + j}"
+                else:
+                    chunk_id = hashlib.blake2b(f"{start_pos + j}:{chunk_content}".encode(), digest_size=16).hexdigest()
                 
                 metadata = {
                     "text": chunk_content,
-                    "position": i + j,
-                    "source": "user_upload" # Placeholder for now
+                    "position": start_pos + j,
+                    "source": "user_upload", # Placeholder for now
+                    "doc_id": source_id or ""
                 }
                 
-                points_to_upsert.append((chunk_id, emb, metadata))
+                point = {"id": chunk_id, "values": emb.tolist(), "metadata": metadata}
+                if sparse_vectors and sparse_vectors[j]['indices']:
+                    point["sparse_values"] = sparse_vectors[j]
+                points_to_upsert.append(point)
+                chunk_ids.append(chunk_id)
 
-        # 3. Upsert to Pinecone (batches of 100 recommended)
-        upsert_batch_size = 100
-        for i in range(0, len(points_to_upsert), upsert_batch_size):
-            batch = points_to_upsert[i : i + upsert_batch_size]
-            self.index.upsert(vectors=batch)
-            
-        return len(chunks)
+            # 3. Upsert to Pinecone (non-blocking)
+            async_results.append(self.index.upsert(vectors=points_to_upsert, namespace=namespace, async_req=True))
+
+        def submit(batch_chunks):
+            pending.append((position, batch_chunks, self.embed_executor.submit(self._embed_documents, batch_chunks)))
+            # Bound in-flight batches so a huge document doesn't queue everything at once
+            while len(pending) > self.embed_workers:
+                upsert_oldest()
 
-    def search(self, query: str) -> Dict[str, Any]:
+        try:
+            batch_chunks = []
+            for chunk in chunks:
+                batch_chunks.append(chunk)
+                if len(batch_chunks) == batch_size:
+                    submit(batch_chunks)
+                    position += len(batch_chunks)
+                    batch_chunks = []
+            if batch_chunks:
+                submit(batch_chunks)
+                position += len(batch_chunks)
+
+            while pending:
+                upsert_oldest()
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+        # Wait for all upserts; .get() re-raises any upsert failure
+        for r in async_results:
+            r.get()
+
+        # New knowledge can change answers, so cached ones are stale now
+        if chunk_ids:
+            self.cache.clear()
+
+        return chunk_ids
+
+    def ingest_scope(self, namespace: str = "") -> str:
         """
-        Full RAG pipeline: Query -> Embed -> Retrieve -> Rerank -> LLM
-        Returns: {
-            "answer": str,
-            "citations": List[Dict],
-            "timings": Dict,
-            "usage": Dict
-        }
+        Identifies where chunks are indexed: the same document ingested into a
+        different index, namespace or embedding dimension must be re-indexed.
         """
-        start_time = time.time()
-        timings = {}
+        return f"{self.index_name}/{namespace}/{self.embed_dim}"
 
-        if not self.index or not self.google_api_key:
-             # Graceful fallback for mock/demo if keys missing
-             if not self.google_api_key: return {"answer": "Error: Missing Google API Key.", "citations": [], "timings": {}}
-        
-        # 1. Embed Query
-        t0 = time.time()
-        query_embedding_res = genai.embed_content(
-            model=self.embed_model,
-            content=query,
-            task_type="retrieval_query"
-        )
-        query_vec = query_embedding_res['embedding']
-        timings['embedding'] = round(time.time() - t0, 3)
-
-        # 2. Retrieve (Vector Search)
-        t0 = time.time()
-        retrieval_res = self.index.query(
-            vector=query_vec,
-            top_k=self.top_k_retrieval,
-            include_metadata=True
-        )
-        
-        retrieved_docs = [] # List of {"text": ..., "id": ...}
-        for match in retrieval_res['matches']:
-            if match.metadata and 'text' in match.metadata:
-                retrieved_docs.append({
-                    "text": match.metadata['text'],
-                    "id": match.id,
-                    "score": match.score # similarity score
-                })
-        timings['retrieval'] = round(time.time() - t0, 3)
+    def has_chunks(self, chunk_ids: List[str], namespace: str = "") -> bool:
+        """
+        Cheap check that previously ingested chunks are still in the index
+        (it may have been wiped or recreated since). Only the first ID is fetched.
+        """
+        if not self.index or not chunk_ids:
+            return False
+        try:
+            result = self.index.fetch(ids=chunk_ids[:1], namespace=namespace)
+            return bool(result.vectors)
+        except Exception as e:
+            logger.warning(f"Pinecone fetch failed: {e}")
+            return False
 
-        if not retrieved_docs:
-            return {
-                "answer": "I couldn't find any relevant information in the uploaded documents.",
-                "citations": [],
-                "timings": timings
-            }
+    def _embed_documents(self, batch_chunks: List[str], max_retries: int = 5) -> np.ndarray:
+        """
+        Embeds one batch of chunks, backing off exponentially on 429 rate limits.
+        Rows are L2-normalized once here so the index can use the cheaper
+        dotproduct metric; queries must be normalized the same way.
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                result = genai.embed_content(
+                    model=self.embed_model,
+                    content=batch_chunks,
+                    task_type="retrieval_document",
+                    output_dimensionality=self.embed_dim
+                )
+                return l2_normalize(result['embedding'])
+            except google_exceptions.TooManyRequests as e:
+                if attempt == max_retries:
+                    raise
+                delay = 2 ** attempt + random.random()
+                logger.warning(f"Embedding rate limited ({e}). Retrying in {delay:.1f}s.")
+                time.sleep(delay)
 
-        # 3. Rerank (Cohere)
-        t0 = time.time()
+    def _rerank(self, query: str, retrieved_docs: List[Dict]) -> List[Dict]:
+        """
+        Reorders the vector matches with the local cross-encoder or Cohere and
+        keeps the best `top_n_rerank`. Falls back to vector order on failure.
+        """
         documents_text = [d['text'] for d in retrieved_docs]
         top_docs = []
         
-        if self.co:
+        if self.local_reranker:
+            try:
+                order = self.local_reranker.rerank(query, documents_text, self.top_n_rerank)
+                top_docs = [retrieved_docs[i] for i in order]
+            except Exception as e:
+                logger.error(f"Local Rerank failed: {e}. Falling back to top vector matches.")
+                top_docs = retrieved_docs[:self.top_n_rerank]
+        elif self.co:
             try:
                 rerank_res = self.co.rerank(
                     model="rerank-english-v3.0",
@@ -230,45 +859,216 @@ class RagEngine:
             # Fallback if no Cohere key
             logger.info("No Cohere key found, skipping reranker.")
             top_docs = retrieved_docs[:self.top_n_rerank]
-            
-        timings['reranking'] = round(time.time() - t0, 3)
+
+        return top_docs
+
+    def retrieve(self, query: str, namespace: str = "") -> List[Dict[str, Any]]:
+        """
+        Vector search only (no rerank / LLM): returns the top `top_k_retrieval`
+        matches as {"text", "id", "score"}, best first.
+        """
+        return self._retrieve_docs(query, self.embed_coalescer.submit(query), namespace)
+
+    def _retrieve_docs(self, query: str, query_vec: np.ndarray, namespace: str = "") -> List[Dict[str, Any]]:
+        sparse = None
+        if self.bm25:
+            # Hybrid: dotproduct over [alpha * dense, (1 - alpha) * sparse]
+            encoded = self.bm25.encode_queries(query)
+            if encoded['indices']:
+                query_vec = query_vec * self.hybrid_alpha
+                sparse = {
+                    "indices": encoded['indices'],
+                    "values": [v * (1 - self.hybrid_alpha) for v in encoded['values']]
+                }
+
+        retrieval_res = self.retrieval_coalescer.submit((query_vec, sparse, namespace))
+        
+        retrieved_docs = [] # List of {"text": ..., "id": ...}
+        for match in retrieval_res['matches']:
+            if match.metadata and 'text' in match.metadata:
+                retrieved_docs.append({
+                    "text": match.metadata['text'],
+                    "id": match.id,
+                    "score": match.score # similarity score
+                })
+        return retrieved_docs
+
+    def search(self, query: str, query_vec: Optional[np.ndarray] = None, namespace: str = "") -> Dict[str, Any]:
+        """
+        Full RAG pipeline: Query -> Embed -> Retrieve -> Rerank -> LLM
+        Returns: {
+            "answer": str,
+            "citations": List[Dict],
+            "citations_used": int, # docs that fit in the context budget
+            "timings": Dict,
+            "cost_estimate": str
+        }
+        """
+        answer_parts = []
+        citations_list = []
+        timings = {}
+        for event in self.search_stream(query, stream_tokens=False, query_vec=query_vec, namespace=namespace):
+            if event['event'] == 'citations':
+                citations_list = event['citations']
+            elif event['event'] == 'token':
+                answer_parts.append(event['text'])
+            elif event['event'] == 'done':
+                timings = event['timings']
+
+        return {
+            "answer": "".join(answer_parts),
+            "citations": citations_list,
+            "citations_used": len(citations_list),
+            "timings": timings,
+            "cost_estimate": "Free (Gemini 2.5 Flash)"
+        }
+
+    def search_stream(self, query: str, stream_tokens: bool = True, query_vec: Optional[np.ndarray] = None, namespace: str = "") -> Iterator[Dict[str, Any]]:
+        """
+        Same pipeline as `search`, as a stream of events so the answer can be
+        shown while Gemini is still generating:
+            {"event": "citations", "citations": List[Dict]}
+            {"event": "token", "text": str}           (one or more)
+            {"event": "done", "timings": Dict}
+        `query_vec` skips the embedding step when it was already batch-embedded.
+        """
+        start_time = time.time()
+        timings = {}
+
+        if not self.index or not self.google_api_key:
+             # Graceful fallback for mock/demo if keys missing
+             if not self.google_api_key:
+                 yield from self._static_answer("Error: Missing Google API Key.", [], {})
+                 return
+        
+        # 1. Embed Query
+        t0 = time.time()
+        if query_vec is None:
+            query_vec = self.embed_coalescer.submit(query)
+        timings['embedding'] = round(time.time() - t0, 3)
+
+        # Short-circuit on a semantically identical earlier question
+        # (the cache only holds answers from the default namespace)
+        cached = self.cache.lookup(query_vec) if not namespace else None
+        if cached:
+            timings['cache_hit'] = True
+            timings['total'] = round(time.time() - start_time, 3)
+            yield from self._static_answer(cached['answer'], cached['citations'], timings)
+            return
+
+        # 2. Retrieve (Vector Search)
+        t0 = time.time()
+        retrieved_docs = self._retrieve_docs(query, query_vec, namespace)
+        timings['retrieval'] = round(time.time() - t0, 3)
+
+        if not retrieved_docs:
+            yield from self._static_answer("I couldn't find any relevant information in the uploaded documents.", [], timings)
+            return
+
+        # 3. Rerank (local cross-encoder or Cohere)
+        # Skipped when the vector top hit already clearly beats the rest of the
+        # shortlist; a reranker rarely reorders such sharp matches. Hybrid
+        # scores need their own threshold (none = always rerank).
+        t0 = time.time()
+        skip_gap = self.rerank_skip_gap_hybrid if self.bm25 else self.rerank_skip_gap
+        gap_idx = min(self.top_n_rerank, len(retrieved_docs) - 1)
+        score_gap = retrieved_docs[0]['score'] - retrieved_docs[gap_idx]['score']
+        if skip_gap is not None and score_gap > skip_gap:
+            top_docs = retrieved_docs[:self.top_n_rerank]
+            timings['reranking'] = 0
+            timings['reranked'] = False
+        else:
+            top_docs = self._rerank(query, retrieved_docs)
+            timings['reranking'] = round(time.time() - t0, 3)
+            timings['reranked'] = True
+        # Logged on both paths to tune RERANK_SKIP_GAP / RERANK_SKIP_GAP_HYBRID offline
+        logger.info(f"Rerank {'applied' if timings['reranked'] else 'skipped'}: {'hybrid' if self.bm25 else 'cosine'} score gap {score_gap:.3f} (threshold {skip_gap})")
 
         # 4. Generate Answer (LLM)
         t0 = time.time()
         
         # Construct Context with [Citation] indices
+        # Docs are added in rerank order until the token budget is spent; the
+        # doc that would overflow it is cut to its head and ends the context.
         context_str = ""
         citations_list = []
+        remaining_tokens = self.context_budget
         
         for idx, doc in enumerate(top_docs):
+            if remaining_tokens <= 0:
+                break
+
+            doc_text = doc['text']
+            doc_tokens = self.count_tokens(doc_text)
+            if doc_tokens > remaining_tokens:
+                doc_text = self.truncate_tokens(doc_text, min(remaining_tokens, self.context_last_doc_tokens))
+                remaining_tokens = 0
+            else:
+                remaining_tokens -= doc_tokens
+
             citation_num = idx + 1
-            context_str += f"Source [{citation_num}]:\n{doc['text']}\n\n"
+            context_str += f"Source [{citation_num}]:\n{doc_text}\n\n"
             citations_list.append({
                 "id": citation_num,
                 "text": doc.get('text', '')[:200] + "...", # Snippet for UI
                 "full_text": doc.get('text', '')
             })
 
-        system_prompt = (
-            "You are an intelligent AI assistant capable of synthesizing information. "
-            "Answer the user's question by *synthesizing* and *summarizing* the relevant information from the provided context below. "
-            "Do not just copy-paste text (extractive); instead, provide a well-written, abstractive summary that directly answers the question. "
-            "However, you MUST still ground your answer in the provided context and include citations [x] where appropriate. "
-            "If the answer is not in the context, say 'I cannot answer this based on the provided documents.'"
-        )
-        
-        full_prompt = f"{system_prompt}\n\nExisting Knowledge:\n{context_str}\n\nUser Question: {query}"
+        yield {"event": "citations", "citations": citations_list}
+
+        # SYSTEM_PROMPT is sent once as a cached system instruction; only the
+        # per-query part goes with each request
+        full_prompt = f"Existing Knowledge:\n{context_str}\n\nUser Question: {query}"
         
         # Use the requested stable model
-        response = self.llm_model.generate_content(full_prompt)
-        answer_text = response.text
+        model = self._get_llm_model()
+        if stream_tokens:
+            answer_parts = []
+            for chunk in model.generate_content(full_prompt, stream=True):
+                if chunk.parts:
+                    answer_parts.append(chunk.text)
+                    yield {"event": "token", "text": chunk.text}
+            answer_text = "".join(answer_parts)
+        else:
+            answer_text = model.generate_content(full_prompt).text
+            yield {"event": "token", "text": answer_text}
         
         timings['generation'] = round(time.time() - t0, 3)
         timings['total'] = round(time.time() - start_time, 3)
 
-        return {
-            "answer": answer_text,
-            "citations": citations_list,
-            "timings": timings,
-            "cost_estimate": "Free (Gemini 2.5 Flash)"
-        }
+        if not namespace:
+            self.cache.add(query_vec, answer_text, citations_list)
+
+        yield {"event": "done", "timings": timings}
+
+    def search_batch(self, questions: List[str], namespace: str = "") -> List[Dict[str, Any]]:
+        """
+        Answers several questions against one namespace: a single batched
+        Gemini embed call, then retrieve / rerank / generate fanned out across
+        threads. Concurrent retrievals coalesce into one Pinecone fan-out.
+        Results are in the same order as `questions`; a question that fails
+        gets {"status": "error", "message": str} without discarding the others.
+        """
+        if not self.google_api_key:
+            query_vecs = [None] * len(questions) # search() reports the missing key
+        else:
+            query_vecs = self._embed_queries(questions)
+
+        def answer(question, query_vec):
+            try:
+                return self.search(question, query_vec=query_vec, namespace=namespace)
+            except Exception as e:
+                logger.error(f"Batch question failed: {e}")
+                return {"status": "error", "message": str(e)}
+
+        with ThreadPoolExecutor(max_workers=min(32, len(questions))) as ex:
+            return list(ex.map(answer, questions, query_vecs))
+
+    @staticmethod
+    def _static_answer(answer: str, citations: List[Dict], timings: Dict) -> Iterator[Dict[str, Any]]:
+        """
+        Event stream for answers that don't come from the LLM (cache hits, errors).
+        """
+        yield {"event": "citations", "citations": citations}
+        yield {"event": "token", "text": answer}
+        yield {"event": "done", "timings": timings}
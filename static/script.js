@@ -103,6 +103,37 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Render Stats
+    function renderTimings(timings) {
+        statsBar.classList.remove('hidden');
+        if (timings) {
+            timeTotal.textContent = `${timings.total || 0}s`;
+            timeRetrieval.textContent = `${timings.retrieval || 0}s`;
+            timeRerank.textContent = `${timings.reranking || 0}s`;
+            timeGen.textContent = `${timings.generation || 0}s`;
+        }
+    }
+
+    // Render Citations
+    function renderCitations(citations) {
+        if (citations && citations.length > 0) {
+            citationsContainer.classList.remove('hidden');
+            citationsList.innerHTML = '';
+
+            citations.forEach(cit => {
+                const card = document.createElement('div');
+                card.className = 'citation-card';
+                card.innerHTML = `
+                    <div>
+                        <span class="citation-badge">[${cit.id}]</span>
+                    </div>
+                    <div class="citation-text">"${cit.text}"</div>
+                `;
+                citationsList.appendChild(card);
+            });
+        }
+    }
+
     // Query Handler
     async function handleQuery() {
         const question = queryInput.value.trim();
@@ -121,43 +152,45 @@ document.addEventListener('DOMContentLoaded', () => {
             const res = await fetch('/query', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ question })
+                body: JSON.stringify({ question, stream: true })
             });
-            const data = await res.json();
 
-            if (res.ok) {
-                // Render Answer (Markdown)
-                responseText.innerHTML = marked.parse(data.answer);
-
-                // Render Stats
-                statsBar.classList.remove('hidden');
-                if (data.timings) {
-                    timeTotal.textContent = `${data.timings.total || 0}s`;
-                    timeRetrieval.textContent = `${data.timings.retrieval || 0}s`;
-                    timeRerank.textContent = `${data.timings.reranking || 0}s`;
-                    timeGen.textContent = `${data.timings.generation || 0}s`;
-                }
+            if (!res.ok) {
+                const data = await res.json();
+                responseText.textContent = "Error: " + (data.message || "Unknown error");
+                return;
+            }
 
-                // Render Citations
-                if (data.citations && data.citations.length > 0) {
-                    citationsContainer.classList.remove('hidden');
-                    citationsList.innerHTML = '';
-
-                    data.citations.forEach(cit => {
-                        const card = document.createElement('div');
-                        card.className = 'citation-card';
-                        card.innerHTML = `
-                            <div>
-                                <span class="citation-badge">[${cit.id}]</span>
-                            </div>
-                            <div class="citation-text">"${cit.text}"</div>
-                        `;
-                        citationsList.appendChild(card);
-                    });
+            // Server-Sent Events: citations, then answer tokens, then timings
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let answer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+
+                for (const raw of events) {
+                    if (!raw.startsWith('data: ')) continue;
+                    const data = JSON.parse(raw.slice(6));
+
+                    if (data.event === 'token') {
+                        // Render Answer (Markdown) as it streams in
+                        answer += data.text;
+                        responseText.innerHTML = marked.parse(answer);
+                    } else if (data.event === 'citations') {
+                        renderCitations(data.citations);
+                    } else if (data.event === 'done') {
+                        renderTimings(data.timings);
+                    } else if (data.event === 'error') {
+                        responseText.textContent = "Error: " + (data.message || "Unknown error");
+                    }
                 }
-
-            } else {
-                responseText.textContent = "Error: " + (data.message || "Unknown error");
             }
         } catch (err) {
             responseText.textContent = "Network error: " + err.message;
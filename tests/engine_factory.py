@@ -0,0 +1,73 @@
+"""
+Builds a real RagEngine for offline tests: `__init__` runs with the API keys
+unset, so no Pinecone/Cohere client or on-disk cache is created, and test
+doubles (fake index, tokenizer, ...) are attached afterwards.
+"""
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+import rag_engine
+
+OFFLINE_ENV = {
+    "PINECONE_API_KEY": "",
+    "COHERE_API_KEY": "",
+    "RERANK_BACKEND": "cohere",
+    "SEMANTIC_CACHE_PATH": "", # in-memory semantic cache
+    "QUERY_COALESCE_MS": "0", # coalescers call straight through
+    "RETRIEVAL_SCAN_FACTOR": "",
+    "RETRIEVAL_MAX_CANDIDATES": "",
+}
+
+class AsyncResult:
+    """Stands in for the result of an `async_req=True` Pinecone call."""
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+    def get(self):
+        if self.error:
+            raise self.error
+        return self.value
+
+class CharTokenizer:
+    """One token per character, so window boundaries are easy to reason about."""
+    def encode(self, text):
+        return [ord(c) for c in text]
+
+    def decode(self, tokens):
+        return "".join(chr(t) for t in tokens)
+
+    def decode_batch(self, batch):
+        return [self.decode(t) for t in batch]
+
+class ScoredIndex:
+    """Returns fixed (id, text, score) matches for every query, best first."""
+    def __init__(self, matches):
+        self.matches = [SimpleNamespace(id=i, metadata={"text": t}, score=s) for i, t, s in matches]
+
+    def query(self, async_req=False, **kwargs):
+        return AsyncResult({"matches": self.matches})
+
+class EchoModel:
+    """Gemini stand-in that records the prompts it was given."""
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        return SimpleNamespace(text="answer [1]")
+
+def fake_embeddings(texts, dim=4):
+    return np.ones((len(texts), dim), dtype=np.float32)
+
+def make_engine(index=None, **attrs):
+    # A non-empty Gemini key only sets model names; genai was configured at import
+    with mock.patch.dict(os.environ, OFFLINE_ENV), mock.patch.object(rag_engine, "GOOGLE_API_KEY", "test"):
+        engine = rag_engine.RagEngine()
+    engine.index = index
+    for name, value in attrs.items():
+        setattr(engine, name, value)
+    return engine
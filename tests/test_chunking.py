@@ -0,0 +1,47 @@
+import unittest
+
+from engine_factory import CharTokenizer, make_engine
+
+def chunker(tokenizer, chunk_size=10, chunk_overlap=3):
+    return make_engine(tokenizer=tokenizer, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+def without_redundant_tail(windows, text_len, step, overlap):
+    # chunk_text also emits trailing windows that lie entirely inside the
+    # previous one's overlap; chunk_stream skips those
+    return [w for i, w in enumerate(windows) if i == 0 or i * step + overlap < text_len]
+
+class TestChunkStream(unittest.TestCase):
+
+    def test_stream_matches_chunk_text_across_pages(self):
+        engine = chunker(CharTokenizer())
+        pages = ["alpha beta gamma", "delta epsilon", "zeta eta theta iota"]
+        joined = "".join(p + "\n" for p in pages)
+
+        expected = without_redundant_tail(engine.chunk_text(joined), len(joined), step=7, overlap=3)
+        self.assertEqual(list(engine.chunk_stream(iter(pages))), expected)
+
+    def test_windows_overlap_by_chunk_overlap(self):
+        engine = chunker(CharTokenizer())
+        chunks = list(engine.chunk_stream(["abcdefghijklmnopqrstuvwxyz"]))
+        for prev, cur in zip(chunks, chunks[1:]):
+            self.assertEqual(prev[-3:], cur[:3])
+        self.assertTrue(all(len(c) <= 10 for c in chunks))
+
+    def test_short_input_yields_single_chunk(self):
+        engine = chunker(CharTokenizer())
+        self.assertEqual(list(engine.chunk_stream(["abc"])), ["abc\n"])
+
+    def test_blank_pages_are_skipped(self):
+        engine = chunker(CharTokenizer())
+        self.assertEqual(list(engine.chunk_stream(["", "  \n", None])), [])
+
+    def test_fallback_without_tokenizer_matches_chunk_text(self):
+        engine = chunker(None, chunk_size=3, chunk_overlap=1) # ~4 chars per token
+        text = "x" * 5 + "y" * 20 + "z" * 15
+        joined = text + "\n"
+
+        expected = without_redundant_tail(engine.chunk_text(joined), len(joined), step=8, overlap=4)
+        self.assertEqual(list(engine.chunk_stream([text])), expected)
+
+if __name__ == '__main__':
+    unittest.main()
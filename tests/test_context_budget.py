@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from engine_factory import CharTokenizer, EchoModel, ScoredIndex, make_engine
+
+def budget_engine(doc_tokens):
+    # One character per token; docs are ranked in the given order
+    matches = [(f"doc{i}", chr(ord("a") + i) * n, 0.9 - 0.01 * i) for i, n in enumerate(doc_tokens)]
+    model = EchoModel()
+    engine = make_engine(
+        index=ScoredIndex(matches), tokenizer=CharTokenizer(), _get_llm_model=lambda: model,
+        context_budget=2000, context_last_doc_tokens=500, top_n_rerank=5,
+        rerank_skip_gap=-1.0 # always skip rerank: context follows vector order
+    )
+    return engine, model
+
+def search(engine):
+    return engine.search("question", query_vec=np.ones(4, dtype=np.float32) / 2)
+
+class TestContextBudget(unittest.TestCase):
+
+    def test_overflowing_doc_cut_to_remaining_budget(self):
+        engine, model = budget_engine([950, 950, 950, 950])
+        result = search(engine)
+
+        # 950 + 950 fit; 100 tokens are left for the third, the fourth is dropped
+        self.assertEqual(result['citations_used'], 3)
+        prompt = model.prompts[0]
+        self.assertIn("Source [2]:\n" + "b" * 950 + "\n\n", prompt)
+        self.assertIn("Source [3]:\n" + "c" * 100 + "\n\n", prompt)
+        self.assertNotIn("Source [4]", prompt)
+        self.assertEqual(result['citations'][2]['full_text'], "c" * 950) # citation keeps the whole doc
+
+    def test_overflowing_doc_capped_at_last_doc_tokens(self):
+        engine, model = budget_engine([950, 400, 950, 950])
+        result = search(engine)
+
+        # 650 tokens remain for the third doc, but only its first 500 are kept
+        self.assertEqual(result['citations_used'], 3)
+        self.assertIn("Source [3]:\n" + "c" * 500 + "\n\n", model.prompts[0])
+        self.assertNotIn("Source [4]", model.prompts[0])
+
+    def test_everything_fits_under_budget(self):
+        engine, model = budget_engine([600, 600, 600])
+        result = search(engine)
+
+        self.assertEqual(result['citations_used'], 3)
+        for i, ch in enumerate("abc"):
+            self.assertIn(f"Source [{i + 1}]:\n" + ch * 600 + "\n\n", model.prompts[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from engine_factory import AsyncResult, fake_embeddings, make_engine
+
+class FakeIndex:
+    """Records upserted points by ID, like Pinecone would."""
+    def __init__(self):
+        self.points = {}
+
+    def upsert(self, vectors, namespace="", async_req=False):
+        for point in vectors:
+            self.points[point["id"]] = point
+        return AsyncResult()
+
+def ingest_engine():
+    return make_engine(index=FakeIndex(), _embed_documents=fake_embeddings)
+
+class TestIngestChunks(unittest.TestCase):
+
+    def test_identical_chunks_get_distinct_ids(self):
+        engine = ingest_engine()
+        chunks = ["Confidential - page header", "body", "Confidential - page header"]
+
+        ids = engine.ingest_chunks(chunks, source_id="doc")
+        self.assertEqual(ids, ["doc#0", "doc#1", "doc#2"])
+        self.assertEqual(len(engine.index.points), 3)
+
+        anonymous = engine.ingest_chunks(chunks)
+        self.assertEqual(len(set(anonymous)), 3)
+
+    def test_reingest_overwrites_in_place(self):
+        engine = ingest_engine()
+        chunks = ["chunk %d" % i for i in range(150)] # spans two batches
+
+        first = engine.ingest_chunks(iter(chunks), source_id="doc")
+        second = engine.ingest_chunks(iter(chunks), source_id="doc")
+        self.assertEqual(first, second)
+        self.assertEqual(len(engine.index.points), 150)
+        self.assertEqual(engine.index.points["doc#120"]["metadata"]["position"], 120)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import rag_engine
+from engine_factory import make_engine
+
+class FakeGenai:
+    """Records context-cache creation instead of calling Gemini."""
+    def __init__(self, fail=False):
+        self.created = []
+        self.fail = fail
+        self.caching = SimpleNamespace(CachedContent=SimpleNamespace(create=self.create))
+        self.GenerativeModel = FakeModel
+
+    def create(self, model, system_instruction, ttl):
+        if self.fail:
+            raise RuntimeError("Cached content is too small")
+        self.created.append(system_instruction)
+        return SimpleNamespace(system_instruction=system_instruction)
+
+class FakeModel:
+    def __init__(self, name, system_instruction=None, cached=None):
+        self.system_instruction = system_instruction
+        self.cached = cached
+
+    @classmethod
+    def from_cached_content(cls, cached):
+        return cls("cached", cached.system_instruction, cached=cached)
+
+LONG_PROMPT = "Answer from the provided context only. " * 200
+
+class TestGetLlmModel(unittest.TestCase):
+
+    def setUp(self):
+        self.genai = FakeGenai()
+        patcher = mock.patch.object(rag_engine, "genai", self.genai)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = make_engine()
+
+    def test_short_prompt_uses_plain_model(self):
+        model = self.engine._get_llm_model()
+        self.assertIsNone(model.cached)
+        self.assertEqual(model.system_instruction, rag_engine.SYSTEM_PROMPT)
+        self.assertEqual(self.genai.created, [])
+
+    def test_long_prompt_is_cached_and_reused(self):
+        with mock.patch.object(rag_engine, "SYSTEM_PROMPT", LONG_PROMPT):
+            first = self.engine._get_llm_model()
+            second = self.engine._get_llm_model()
+
+        self.assertIsNotNone(first.cached)
+        self.assertIs(first, second)
+        self.assertEqual(self.genai.created, [LONG_PROMPT])
+
+    def test_cache_recreated_near_ttl_and_on_prompt_change(self):
+        with mock.patch.object(rag_engine, "SYSTEM_PROMPT", LONG_PROMPT):
+            self.engine._get_llm_model()
+            self.engine.llm_model_expiry = 0 # TTL about to run out
+            self.engine._get_llm_model()
+        with mock.patch.object(rag_engine, "SYSTEM_PROMPT", LONG_PROMPT + "Be brief."):
+            self.engine._get_llm_model()
+
+        self.assertEqual(self.genai.created, [LONG_PROMPT, LONG_PROMPT, LONG_PROMPT + "Be brief."])
+
+    def test_rejected_cache_falls_back_to_plain_model(self):
+        self.genai.fail = True
+        with mock.patch.object(rag_engine, "SYSTEM_PROMPT", LONG_PROMPT):
+            model = self.engine._get_llm_model()
+
+        self.assertIsNone(model.cached)
+        self.assertEqual(model.system_instruction, LONG_PROMPT)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import unittest
+
+from app import iter_pdf_pages
+
+class Page:
+    def __init__(self, text):
+        self.text = text
+
+    def extract_text(self):
+        if isinstance(self.text, Exception):
+            raise self.text
+        return self.text
+
+class Reader:
+    def __init__(self, texts):
+        self.pages = [Page(t) for t in texts]
+
+class TestIterPdfPages(unittest.TestCase):
+
+    def consume(self, pages):
+        # Runs the consumer in a thread so a hang fails the test instead of the suite
+        out = {}
+        def run():
+            try:
+                out["pages"] = list(pages)
+            except Exception as e:
+                out["error"] = e
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        t.join(5)
+        self.assertFalse(t.is_alive(), "consumer blocked")
+        return out
+
+    def test_yields_pages_and_reports_completion(self):
+        done = []
+        out = self.consume(iter_pdf_pages(Reader(["p1", "", "p3"]), on_complete=done.append))
+        self.assertEqual(out["pages"], ["p1", "", "p3"])
+        self.assertEqual(done, [["p1", "", "p3"]])
+
+    def test_failing_on_complete_does_not_block_consumer(self):
+        def on_complete(texts):
+            raise OSError("disk full")
+
+        out = self.consume(iter_pdf_pages(Reader(["p1", "p2"]), on_complete=on_complete))
+        self.assertEqual(out["pages"], ["p1", "p2"])
+
+    def test_extraction_error_reaches_consumer(self):
+        out = self.consume(iter_pdf_pages(Reader(["p1", ValueError("bad xref")])))
+        self.assertIsInstance(out["error"], ValueError)
+
+    def test_on_complete_runs_after_consumer_stops_early(self):
+        finished = threading.Event()
+        done = []
+        def on_complete(texts):
+            done.append(texts)
+            finished.set()
+
+        pages = iter_pdf_pages(Reader([str(i) for i in range(40)]), max_buffered=2, on_complete=on_complete)
+        self.assertEqual(next(pages), "0")
+        pages.close() # e.g. ingest failed
+
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(len(done[0]), 40)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import threading
+import unittest
+
+from rag_engine import QueryCoalescer
+
+class TestQueryCoalescer(unittest.TestCase):
+
+    def run_concurrently(self, coalescer, items, catch=Exception):
+        results = [None] * len(items)
+        errors = [None] * len(items)
+        barrier = threading.Barrier(len(items))
+
+        def worker(i):
+            barrier.wait()
+            try:
+                results[i] = coalescer.submit(items[i])
+            except catch as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(items))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_concurrent_submits_share_one_batch(self):
+        batches = []
+        def batch_fn(items):
+            batches.append(list(items))
+            return [x * 10 for x in items]
+
+        coalescer = QueryCoalescer(batch_fn, window_ms=200)
+        results, errors = self.run_concurrently(coalescer, [1, 2, 3, 4])
+
+        self.assertEqual(results, [10, 20, 30, 40]) # each caller gets its own result
+        self.assertEqual(errors, [None] * 4)
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(sorted(batches[0]), [1, 2, 3, 4])
+
+    def test_full_batch_flushes_without_waiting(self):
+        batches = []
+        def batch_fn(items):
+            batches.append(list(items))
+            return items
+
+        coalescer = QueryCoalescer(batch_fn, window_ms=200, max_batch=2)
+        results, _ = self.run_concurrently(coalescer, [1, 2, 3, 4])
+
+        self.assertEqual(results, [1, 2, 3, 4])
+        self.assertTrue(all(len(b) <= 2 for b in batches))
+
+    def test_exception_reaches_every_caller_in_batch(self):
+        def batch_fn(items):
+            raise RuntimeError("quota exceeded")
+
+        coalescer = QueryCoalescer(batch_fn, window_ms=200)
+        results, errors = self.run_concurrently(coalescer, [1, 2, 3])
+
+        self.assertEqual(results, [None] * 3)
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+
+    def test_per_item_exception_only_fails_its_caller(self):
+        def batch_fn(items):
+            return [ValueError(x) if x == 2 else x for x in items]
+
+        coalescer = QueryCoalescer(batch_fn, window_ms=200)
+        results, errors = self.run_concurrently(coalescer, [1, 2, 3])
+
+        self.assertEqual(results, [1, None, 3])
+        self.assertIsInstance(errors[1], ValueError)
+        self.assertEqual([errors[0], errors[2]], [None, None])
+
+    def test_short_result_list_does_not_block_callers(self):
+        coalescer = QueryCoalescer(lambda items: items[:1], window_ms=200)
+        results, errors = self.run_concurrently(coalescer, [1, 2, 3])
+
+        self.assertEqual(sum(r is not None for r in results), 1)
+        self.assertEqual(sum(isinstance(e, RuntimeError) for e in errors), 2)
+
+    def test_base_exception_still_resolves_followers(self):
+        class Interrupt(BaseException): # e.g. gevent.Timeout / GreenletExit
+            pass
+
+        def batch_fn(items):
+            raise Interrupt()
+
+        coalescer = QueryCoalescer(batch_fn, window_ms=200)
+        results, errors = self.run_concurrently(coalescer, [1, 2, 3], catch=BaseException)
+
+        self.assertEqual(results, [None] * 3)
+        self.assertEqual(sum(isinstance(e, Interrupt) for e in errors), 1) # the flushing caller
+        self.assertEqual(sum(isinstance(e, RuntimeError) for e in errors), 2)
+
+    def test_zero_window_calls_through(self):
+        calls = []
+        coalescer = QueryCoalescer(lambda items: calls.append(items) or items, window_ms=0)
+        self.assertEqual(coalescer.submit("q"), "q")
+        self.assertEqual(calls, [["q"]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from engine_factory import EchoModel, ScoredIndex, make_engine
+
+class FakeBM25:
+    def encode_queries(self, query):
+        return {"indices": [1], "values": [1.0]}
+
+def pipeline_engine(scores, bm25=None, **attrs):
+    matches = [(f"doc{i}", f"text {i}", s) for i, s in enumerate(scores)]
+    rerank = mock.Mock(side_effect=lambda query, docs: docs[::-1][:5])
+    return make_engine(
+        index=ScoredIndex(matches), bm25=bm25, _rerank=rerank, _get_llm_model=EchoModel,
+        top_n_rerank=5, rerank_skip_gap=0.15, rerank_skip_gap_hybrid=None, **attrs
+    )
+
+def search(engine):
+    return engine.search("question", query_vec=np.ones(4, dtype=np.float32) / 2)
+
+class TestRerankSkip(unittest.TestCase):
+
+    def test_sharp_top_hit_skips_rerank(self):
+        engine = pipeline_engine([0.92, 0.60, 0.58, 0.57, 0.55, 0.54, 0.50])
+        result = search(engine)
+
+        engine._rerank.assert_not_called()
+        self.assertFalse(result['timings']['reranked'])
+        self.assertEqual(result['timings']['reranking'], 0)
+        self.assertEqual(result['citations_used'], 5) # first top_n_rerank in vector order
+
+    def test_close_scores_are_reranked(self):
+        engine = pipeline_engine([0.70, 0.69, 0.68, 0.66, 0.65, 0.64, 0.60])
+        result = search(engine)
+
+        engine._rerank.assert_called_once()
+        self.assertTrue(result['timings']['reranked'])
+        self.assertEqual(result['citations'][0]['full_text'], "text 6") # rerank order is used
+
+    def test_hybrid_scores_always_rerank_without_hybrid_threshold(self):
+        engine = pipeline_engine([3.5, 0.6, 0.5, 0.5, 0.4, 0.4, 0.3], bm25=FakeBM25())
+        result = search(engine)
+
+        engine._rerank.assert_called_once()
+        self.assertTrue(result['timings']['reranked'])
+
+    def test_hybrid_threshold_applies_to_hybrid_scores(self):
+        engine = pipeline_engine([3.5, 0.6, 0.5, 0.5, 0.4, 0.4, 0.3], bm25=FakeBM25())
+        engine.rerank_skip_gap_hybrid = 2.0
+        result = search(engine)
+
+        engine._rerank.assert_not_called()
+        self.assertFalse(result['timings']['reranked'])
+
+if __name__ == '__main__':
+    unittest.main()
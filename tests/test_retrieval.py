@@ -0,0 +1,83 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from engine_factory import AsyncResult, make_engine
+from rag_engine import l2_normalize
+
+class FakeBM25:
+    def encode_queries(self, query):
+        return {"indices": [1, 2], "values": [0.5, 0.5]}
+
+class FakeIndex:
+    """Answers hybrid queries like a dotproduct index over [dense, sparse]."""
+    def __init__(self, stored, sparse_scores):
+        self.stored = stored # id -> normalized dense vector
+        self.sparse_scores = sparse_scores # id -> raw BM25 dot product
+        self.queries = []
+
+    def query(self, vector, sparse_vector=None, async_req=False, **kwargs):
+        self.queries.append({"vector": vector, "sparse_vector": sparse_vector, **kwargs})
+        vec = np.asarray(vector)
+        weight = sum(sparse_vector["values"]) if sparse_vector else 0.0
+        matches = []
+        for doc_id, values in self.stored.items():
+            score = float(vec @ values) + weight * self.sparse_scores[doc_id]
+            matches.append(SimpleNamespace(id=doc_id, score=score, metadata={"text": doc_id}))
+        matches.sort(key=lambda m: -m.score)
+        return AsyncResult({"matches": matches})
+
+def retrieval_engine(bm25, stored, sparse_scores, alpha=0.5):
+    return make_engine(index=FakeIndex(stored, sparse_scores), bm25=bm25, hybrid_alpha=alpha)
+
+class TestRetrieveDocs(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.query = l2_normalize(rng.normal(size=16))
+        self.stored = {
+            "close": l2_normalize(self.query + 0.1 * rng.normal(size=16)),
+            "far": l2_normalize(rng.normal(size=16)),
+        }
+        # BM25 heavily favours the semantically distant doc
+        self.sparse_scores = {"close": 0.0, "far": 8.0}
+
+    def test_hybrid_query_weights_dense_and_sparse_parts(self):
+        engine = retrieval_engine(FakeBM25(), self.stored, self.sparse_scores, alpha=0.75)
+        docs = engine._retrieve_docs("query", self.query)
+
+        sent = engine.index.queries[0]
+        np.testing.assert_allclose(sent["vector"], 0.75 * self.query, rtol=1e-6)
+        self.assertEqual(sent["sparse_vector"]["values"], [0.125, 0.125])
+        self.assertNotIn("include_values", sent) # no vectors shipped back per query
+        self.assertEqual(docs[0]["id"], "far") # ranked by the unbounded hybrid score
+        self.assertGreater(docs[0]["score"], 1.0)
+
+    def test_dense_only_without_bm25(self):
+        engine = retrieval_engine(None, self.stored, self.sparse_scores)
+        docs = engine._retrieve_docs("query", self.query)
+
+        self.assertIsNone(engine.index.queries[0]["sparse_vector"])
+        self.assertEqual([d["id"] for d in docs], ["close", "far"])
+        self.assertAlmostEqual(docs[0]["score"], float(self.stored["close"] @ self.query), places=5)
+
+class FailingNamespaceIndex:
+    """Fails queries on one namespace, as a bad request would."""
+    def query(self, vector, namespace="", async_req=False, **kwargs):
+        if namespace == "missing":
+            return AsyncResult(error=RuntimeError("namespace not found"))
+        return AsyncResult({"matches": [], "namespace": namespace})
+
+class TestQueryIndex(unittest.TestCase):
+
+    def test_failed_request_only_fails_its_own_slot(self):
+        engine = make_engine(index=FailingNamespaceIndex())
+        vec = np.ones(4, dtype=np.float32)
+
+        results = engine._query_index([(vec, None, "a"), (vec, None, "missing"), (vec, None, "b")])
+        self.assertEqual([r["namespace"] for r in (results[0], results[2])], ["a", "b"])
+        self.assertIsInstance(results[1], RuntimeError)
+
+if __name__ == '__main__':
+    unittest.main()
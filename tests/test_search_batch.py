@@ -0,0 +1,26 @@
+import unittest
+
+import numpy as np
+
+from engine_factory import make_engine
+
+class TestSearchBatch(unittest.TestCase):
+
+    def test_failed_question_does_not_discard_the_batch(self):
+        def search(question, query_vec=None, namespace=""):
+            if question == "bad":
+                raise RuntimeError("Gemini quota exceeded")
+            return {"answer": question.upper()}
+
+        engine = make_engine(
+            _embed_queries=lambda qs: np.ones((len(qs), 4), dtype=np.float32),
+            search=search
+        )
+        results = engine.search_batch(["one", "bad", "three"])
+
+        self.assertEqual(results[0], {"answer": "ONE"})
+        self.assertEqual(results[1], {"status": "error", "message": "Gemini quota exceeded"})
+        self.assertEqual(results[2], {"answer": "THREE"})
+
+if __name__ == '__main__':
+    unittest.main()
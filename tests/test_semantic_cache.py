@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from rag_engine import SemanticCache, l2_normalize
+
+def unit(seed, dim=32):
+    return l2_normalize(np.random.default_rng(seed).normal(size=dim))
+
+def citations(n=1):
+    return [{"id": i + 1, "text": "snippet...", "full_text": "full " * 50} for i in range(n)]
+
+class TestSemanticCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hit_on_near_duplicate_and_miss_on_unrelated(self):
+        cache = SemanticCache(threshold=0.92)
+        q = unit(0)
+        cache.add(q, "answer", citations())
+
+        near = l2_normalize(q + 0.01 * unit(1))
+        self.assertEqual(cache.lookup(near)["answer"], "answer")
+        self.assertIsNone(cache.lookup(unit(2)))
+
+    def test_hit_via_int8_path_without_shadow(self):
+        cache = SemanticCache(shadow_size=0)
+        q = unit(0)
+        cache.add(q, "answer", citations())
+        self.assertFalse(cache.shadow)
+        self.assertEqual(cache.lookup(q)["answer"], "answer")
+
+    def test_lru_eviction_keeps_recently_used(self):
+        cache = SemanticCache(max_entries=2)
+        a, b, c = unit(0), unit(1), unit(2)
+        cache.add(a, "a", [])
+        cache.add(b, "b", [])
+        cache.lookup(a) # a is now more recent than b
+        cache.add(c, "c", [])
+
+        self.assertEqual(cache.lookup(a)["answer"], "a")
+        self.assertIsNone(cache.lookup(b))
+        self.assertEqual(cache.lookup(c)["answer"], "c")
+
+    def test_flush_and_reload_keeps_citations_whole(self):
+        cache = SemanticCache(path=self.path)
+        q = unit(0)
+        cache.add(q, "answer", citations(2))
+        cache.flush()
+
+        hit = SemanticCache(path=self.path).lookup(q)
+        self.assertEqual(hit["answer"], "answer")
+        self.assertEqual([c["id"] for c in hit["citations"]], [1, 2])
+        self.assertEqual(hit["citations"], citations(2)) # same shape as a fresh answer
+
+    def test_torn_file_loads_as_empty(self):
+        cache = SemanticCache(path=self.path)
+        cache.add(unit(0), "answer", citations())
+        cache.flush()
+
+        with open(self.path + ".npz", "rb") as f:
+            data = f.read()
+        with open(self.path + ".npz", "wb") as f:
+            f.write(data[: len(data) // 2])
+
+        self.assertIsNone(SemanticCache(path=self.path).lookup(unit(0)))
+
+    def test_clear_invalidates_other_processes(self):
+        q = unit(0)
+        worker_a = SemanticCache(path=self.path, generation_check_interval=0)
+        worker_b = SemanticCache(path=self.path, generation_check_interval=0)
+        worker_a.add(q, "stale", [])
+        worker_a.flush()
+
+        worker_a.clear() # e.g. worker A handled an ingest
+        worker_b.add(q, "stale", [])
+        self.assertIsNone(worker_b.lookup(q))
+
+    def test_stale_flush_does_not_overwrite_after_clear(self):
+        q = unit(0)
+        worker_a = SemanticCache(path=self.path)
+        worker_b = SemanticCache(path=self.path)
+        worker_b.add(q, "stale", [])
+
+        worker_a.clear()
+        worker_b.flush() # pending save from before the clear
+
+        self.assertIsNone(SemanticCache(path=self.path).lookup(q))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from upload_cache import UploadCache
+
+class TestUploadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = UploadCache(cache_dir=self.tmp.name, max_entries=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def age(self, digest, seconds):
+        # Backdate every file of a digest so LRU order doesn't depend on mtime resolution
+        for suffix in ("txt", "ingested"):
+            path = self.cache._path(digest, suffix)
+            if os.path.exists(path):
+                t = time.time() - seconds
+                os.utime(path, (t, t))
+
+    def test_text_roundtrip_and_miss(self):
+        digest = UploadCache.key(b"%PDF-1.4 ...")
+        self.assertIsNone(self.cache.get_text(digest))
+        self.cache.put_text(digest, "page one\npage two")
+        self.assertEqual(self.cache.get_text(digest), "page one\npage two")
+
+    def test_ingested_is_scoped(self):
+        self.cache.mark_ingested("a", "index-1//768", ["a#0", "a#1"])
+        self.cache.mark_ingested("a", "index-1/docs/768", ["a#0"])
+
+        self.assertEqual(self.cache.get_ingested("a", "index-1//768"), ["a#0", "a#1"])
+        self.assertEqual(self.cache.get_ingested("a", "index-1/docs/768"), ["a#0"])
+        self.assertIsNone(self.cache.get_ingested("a", "index-2//768"))
+        self.assertIsNone(self.cache.get_ingested("a", "index-1//1536"))
+
+    def test_sweep_evicts_least_recently_used_digest(self):
+        self.cache.put_text("a", "A")
+        self.cache.mark_ingested("a", "s", ["a#0"])
+        self.cache.put_text("b", "B")
+        self.age("a", 30)
+        self.age("b", 20)
+
+        self.cache.get_text("a") # a is now more recent than b
+        self.cache.put_text("c", "C")
+
+        self.assertEqual(self.cache.get_text("a"), "A")
+        self.assertEqual(self.cache.get_ingested("a", "s"), ["a#0"])
+        self.assertIsNone(self.cache.get_text("b"))
+        self.assertEqual(self.cache.get_text("c"), "C")
+
+    def test_sweep_removes_all_files_of_evicted_digest(self):
+        self.cache.put_text("a", "A")
+        self.cache.mark_ingested("a", "s", ["a#0"])
+        self.age("a", 30)
+        self.cache.put_text("b", "B")
+        self.cache.put_text("c", "C")
+
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["b.txt", "c.txt"])
+
+    def test_sweep_tolerates_files_removed_concurrently(self):
+        self.cache.put_text("a", "A")
+        self.cache.put_text("b", "B")
+        getmtime = os.path.getmtime
+
+        def vanishing(path):
+            if path.endswith("a.txt"):
+                raise FileNotFoundError(path) # evicted by another worker mid-sweep
+            return getmtime(path)
+
+        with mock.patch("os.path.getmtime", vanishing):
+            self.cache.put_text("c", "C")
+            self.cache.mark_ingested("c", "s", ["c#0"])
+
+        self.assertEqual(self.cache.get_ingested("c", "s"), ["c#0"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class UploadCache:
+    """
+    Disk cache for uploaded files, keyed by SHA-256 of their bytes:
+        {digest}.txt       extracted text (skips PDF parsing on re-upload)
+        {digest}.ingested  JSON map of ingest scope (index/namespace/dimension,
+                           see `RagEngine.ingest_scope`) -> chunk IDs upserted there
+    Bounded to `max_entries` digests, evicting the least recently used
+    (file mtimes are bumped on every hit).
+    """
+    def __init__(self, cache_dir: str = "cache/uploads", max_entries: int = 200):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(raw: bytes) -> str:
+        return hashlib.sha256(raw).hexdigest()
+
+    def _path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.{suffix}")
+
+    def _read(self, digest: str, suffix: str) -> Optional[str]:
+        path = self._path(digest, suffix)
+        try:
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+            os.utime(path) # mark as recently used
+            return content
+        except OSError:
+            return None
+
+    def _write(self, digest: str, suffix: str, content: str):
+        path = self._path(digest, suffix)
+        try:
+            # Unique temp name: several workers may write the same digest at once
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"Failed to write upload cache entry: {e}")
+            return
+        self._sweep()
+
+    def get_text(self, digest: str) -> Optional[str]:
+        return self._read(digest, "txt")
+
+    def put_text(self, digest: str, text: str):
+        self._write(digest, "txt", text)
+
+    def _read_ingested(self, digest: str) -> Dict[str, List[str]]:
+        content = self._read(digest, "ingested")
+        try:
+            scopes = json.loads(content) if content is not None else {}
+        except ValueError:
+            return {}
+        return scopes if isinstance(scopes, dict) else {}
+
+    def get_ingested(self, digest: str, scope: str) -> Optional[List[str]]:
+        return self._read_ingested(digest).get(scope)
+
+    def mark_ingested(self, digest: str, scope: str, chunk_ids: List[str]):
+        scopes = self._read_ingested(digest)
+        scopes[scope] = chunk_ids
+        self._write(digest, "ingested", json.dumps(scopes))
+
+    def _sweep(self):
+        # Group files by digest; a digest's recency is its newest file
+        # Other workers sweep the same directory, so files may vanish under us
+        last_used = {}
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            digest, _, suffix = name.partition(".")
+            if suffix not in ("txt", "ingested"):
+                continue
+            try:
+                mtime = os.path.getmtime(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            last_used[digest] = max(mtime, last_used.get(digest, 0))
+
+        excess = len(last_used) - self.max_entries
+        if excess <= 0:
+            return
+
+        for digest in sorted(last_used, key=last_used.get)[:excess]:
+            for suffix in ("txt", "ingested"):
+                try:
+                    os.remove(self._path(digest, suffix))
+                except OSError:
+                    pass
@@ -0,0 +1,12 @@
+# Production entry point: gunicorn -k gevent wsgi:app (see Procfile)
+# gevent must patch the stdlib before anything imports socket/ssl/threading,
+# so blocking calls to Gemini, Pinecone and Cohere yield to other requests.
+from gevent import monkey
+monkey.patch_all()
+
+# gRPC (used by the Gemini SDK) needs its own hook to cooperate with gevent
+import grpc.experimental.gevent as grpc_gevent
+grpc_gevent.init_gevent()
+
+# One module-level RagEngine: all greenlets in a worker share its clients and connection pools
+from app import app  # noqa: E402